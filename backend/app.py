@@ -1,10 +1,15 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, request
+from flask_compress import Compress
 from flask_cors import CORS
+from cachetools import TTLCache
 from dotenv import load_dotenv
 import os
+import orjson
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Import functions from other files
-from cloudwatch import get_cloudwatch_logs
+from cloudwatch import iter_cloudwatch_logs, start_cloudwatch_logs_etag
 from guardduty import get_guardduty_findings
 
 # Load environment variables from .env file
@@ -13,18 +18,129 @@ load_dotenv()
 app = Flask(__name__)
 # Enable CORS for requests from the Streamlit frontend (adjust origin if needed)
 CORS(app)
+# Compress responses; JSON log payloads shrink by roughly an order of magnitude
+Compress(app)
+
+# Successful AWS results are reused for a few seconds so dashboards polling
+# faster than CloudWatch/GuardDuty change don't trigger a full fetch each time
+RESULT_CACHE_TTL_SECONDS = 5
+result_cache = TTLCache(maxsize=8, ttl=RESULT_CACHE_TTL_SECONDS)
+result_cache_lock = threading.Lock() # TTLCache is not thread-safe
+# Streamed bodies larger than this aren't cached, so buffering one for the
+# cache never costs more memory per request than this
+MAX_CACHED_STREAM_BYTES = 4 * 1024 * 1024
+# How long a request waits for the newest-event lookup before going without an ETag
+ETAG_LOOKUP_TIMEOUT_SECONDS = 10
+
+def ojson(obj, status=200):
+    """Builds a JSON response with orjson instead of Flask's stdlib-based jsonify."""
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), status=status, mimetype='application/json')
+
+def cache_get(key):
+    """Returns the cached value for key, or None if missing or expired."""
+    with result_cache_lock:
+        return result_cache.get(key)
+
+def cache_put(key, value):
+    """Stores value under key until the TTL expires."""
+    with result_cache_lock:
+        result_cache[key] = value
+
+def etag_result(etag_lookup):
+    """Returns the looked-up ETag, or None if the lookup didn't finish in time."""
+    try:
+        return etag_lookup.result(timeout=ETAG_LOOKUP_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        print("Warning: timed out waiting for the CloudWatch log ETag")
+        return None
+
+def cache_stream(chunks, key, etag, is_complete):
+    """
+    Passes chunks through, caching the body once the stream finishes.
+    Nothing is cached if is_complete() is False by then (e.g. a truncated stream),
+    or once the body grows past MAX_CACHED_STREAM_BYTES; buffering stops there.
+    """
+    body = []
+    body_size = 0
+    for chunk in chunks:
+        if body is not None:
+            body_size += len(chunk)
+            if body_size > MAX_CACHED_STREAM_BYTES:
+                body = None # Too big to cache, stream the rest without holding it
+            else:
+                body.append(chunk)
+        yield chunk
+    if body is not None and is_complete():
+        cache_put(key, (b''.join(body), etag))
+
+def stream_json_array(records, chunk_size=500):
+    """Serializes records as a JSON array, yielding it in chunks as records arrive."""
+    yield b'['
+    separator = b''
+    chunk = []
+    for record in records:
+        chunk.append(orjson.dumps(record))
+        if len(chunk) == chunk_size:
+            yield separator + b','.join(chunk)
+            separator = b','
+            chunk = []
+    if chunk:
+        yield separator + b','.join(chunk)
+    yield b']'
 
 @app.route('/api/logs', methods=['GET'])
 def logs_endpoint():
-    """API endpoint to retrieve CloudWatch logs."""
-    logs, status_code = get_cloudwatch_logs()
-    return jsonify(logs), status_code
+    """
+    API endpoint to retrieve CloudWatch logs.
+    Optional `since` query parameter (epoch milliseconds) limits the response
+    to events with a timestamp at or after it, as reported in each record's
+    `eventTimestampMs`.
+    """
+    since = request.args.get('since', type=int)
+    cache_key = ('logs', since)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        body, etag = cached
+    else:
+        body = None
+        # Let polling clients skip the full fetch when the stream hasn't changed.
+        # The ETag is weak since it identifies the newest event, not the exact bytes.
+        # It is resolved before pagination starts, so it can only be older than the
+        # body (a harmless refetch next poll), never newer (a 304 hiding events)
+        etag = etag_result(start_cloudwatch_logs_etag())
+
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    if body is not None:
+        response = Response(body, mimetype='application/json')
+    else:
+        logs, status_code = iter_cloudwatch_logs(since)
+        if status_code != 200:
+            return ojson(logs, status_code)
+        # Stream the array so the first page ships while later pages are still being fetched
+        response = Response(cache_stream(stream_json_array(logs), cache_key, etag, lambda: logs.complete), mimetype='application/json')
+        # HEAD requests and early disconnects close the response without iterating
+        # the body, so the producer is released when the response closes
+        response.call_on_close(logs.close)
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
 
 @app.route('/api/threats', methods=['GET'])
 def threats_endpoint():
     """API endpoint to retrieve GuardDuty findings."""
-    threats, status_code = get_guardduty_findings()
-    return jsonify(threats), status_code
+    body = cache_get('threats')
+    if body is None:
+        threats, status_code = get_guardduty_findings()
+        if status_code != 200:
+            return ojson(threats, status_code)
+        # Cache the serialized body so cache hits skip encoding entirely
+        body = orjson.dumps(threats, option=orjson.OPT_NON_STR_KEYS)
+        cache_put('threats', body)
+    return Response(body, mimetype='application/json')
 
 if __name__ == '__main__':
     # Runs on http://127.0.0.1:5000 by default
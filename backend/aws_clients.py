@@ -0,0 +1,25 @@
+import boto3
+import functools
+from botocore.config import Config
+
+# Larger keep-alive connection pool so concurrent requests (and background
+# fetch threads) reuse TLS connections instead of handshaking again
+CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'max_attempts': 3, 'mode': 'adaptive'},
+    tcp_keepalive=True
+)
+
+@functools.lru_cache(maxsize=4)
+def get_client(service_name, region_name, aws_access_key_id, aws_secret_access_key):
+    """
+    Returns a Boto3 client for service_name, built once and reused across requests.
+    boto3 clients are thread-safe, so concurrent requests can share it.
+    """
+    return boto3.client(
+        service_name,
+        region_name=region_name,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        config=CLIENT_CONFIG
+    )
@@ -1,7 +1,11 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import time
 import random
-import json
+import orjson
+import itertools
 from datetime import datetime
 
 # --- Configuration ---
@@ -10,6 +14,8 @@ LOG_LEVEL = logging.INFO         # Logging level (e.g., INFO, WARNING, ERROR)
 SIMULATION_DURATION_SECONDS = 300 # How long the simulation runs (e.g., 300 seconds = 5 minutes)
 MIN_DELAY_SECONDS = 0.5           # Minimum delay between actions
 MAX_DELAY_SECONDS = 3.0           # Maximum delay between actions
+LOAD_TEST_MODE = False            # Skip the delays to emit logs as fast as possible (stress-tests the CloudWatch pipeline)
+SAMPLE_BUFFER_SIZE = 10000        # Random picks pre-generated per refill
 
 # --- Mock Data ---
 USERNAMES = ["alice", "bob", "charlie", "david", "eve", "frank", "grace"]
@@ -18,25 +24,60 @@ RESOURCES = ["/api/v1/data", "/api/v1/profile", "/api/v1/settings", "/admin/dash
 ACTIONS = ["login", "logout", "read_data", "write_data", "update_profile", "access_denied", "transaction_process"]
 TRANSACTION_STATUS = ["SUCCESS", "FAILED_INSUFFICIENT_FUNDS", "FAILED_TIMEOUT", "FAILED_INVALID_ITEM"]
 
+# --- Random Sampling ---
+class RandomPicker:
+    """Pre-generates random picks in bulk and hands them out one at a time."""
+    def __init__(self, population, weights=None):
+        self.population = population
+        # Cumulative weights are computed once instead of on every random.choices call
+        self.cum_weights = list(itertools.accumulate(weights)) if weights else None
+        self.buffer = []
+
+    def pick(self):
+        if not self.buffer:
+            self.buffer = random.choices(self.population, cum_weights=self.cum_weights, k=SAMPLE_BUFFER_SIZE)
+        return self.buffer.pop()
+
+user_picker = RandomPicker(USERNAMES)
+ip_picker = RandomPicker(SOURCE_IPS)
+resource_picker = RandomPicker(RESOURCES)
+data_action_picker = RandomPicker(["read_data", "write_data"])
+transaction_status_picker = RandomPicker(TRANSACTION_STATUS)
+login_success_picker = RandomPicker([True, False], weights=[90, 10]) # 90% success rate
+access_allowed_picker = RandomPicker([True, False], weights=[85, 15]) # 85% allowed rate
+
 # --- Logging Setup ---
 # Use JSON formatter for structured logs, easily parsable by SIEM tools
 class JsonFormatter(logging.Formatter):
+    # Optional fields copied from the record's `extra` data, in output order
+    EXTRA_FIELDS = ('source_ip', 'user', 'action', 'status', 'resource', 'transaction_id', 'details')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Formatted whole second of the last record, reused while records share it
+        self._cached_second = None
+        self._cached_second_str = ''
+
+    def formatTime(self, record, datefmt=None):
+        """Formats record.created as ISO 8601 UTC with milliseconds."""
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_second_str = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second))
+        return f"{self._cached_second_str}.{int(record.msecs):03d}Z"
+
     def format(self, record):
         log_record = {
             "timestamp": self.formatTime(record, self.datefmt),
             "level": record.levelname,
             "message": record.getMessage(),
-            "source_ip": getattr(record, 'source_ip', 'N/A'),
-            "user": getattr(record, 'user', 'N/A'),
-            "action": getattr(record, 'action', 'N/A'),
-            "status": getattr(record, 'status', 'N/A'),
-            "resource": getattr(record, 'resource', 'N/A'),
-            "transaction_id": getattr(record, 'transaction_id', 'N/A'),
-            "details": getattr(record, 'details', 'N/A')
         }
-        # Remove keys with 'N/A' values for cleaner logs
-        log_record = {k: v for k, v in log_record.items() if v != 'N/A'}
-        return json.dumps(log_record)
+        # Only include the fields that were actually set, for cleaner logs
+        record_fields = record.__dict__
+        for field in self.EXTRA_FIELDS:
+            if field in record_fields:
+                log_record[field] = record_fields[field]
+        return orjson.dumps(log_record).decode()
 
 # Configure root logger
 logger = logging.getLogger('MockAppLogger')
@@ -48,11 +89,18 @@ try:
     file_handler.setLevel(LOG_LEVEL)
 
     # Create and set formatter
-    formatter = JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S.%fZ') # ISO 8601 format often preferred
+    formatter = JsonFormatter() # Timestamps are ISO 8601 UTC, e.g. 2025-04-29T00:18:00.123Z
     file_handler.setFormatter(formatter)
 
+    # Write to the file from a background thread so logging calls in the
+    # simulation loop only enqueue the record instead of blocking on disk
+    log_queue = queue.Queue(-1)
+    queue_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    queue_listener.start()
+    atexit.register(queue_listener.stop) # Flushes any queued records on exit
+
     # Add handler to the logger
-    logger.addHandler(file_handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
     # Optional: Add a stream handler to also print logs to console
     # stream_handler = logging.StreamHandler()
@@ -64,47 +112,47 @@ except IOError as e:
     # Optionally, fall back to console logging only
     logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
     logger = logging.getLogger(__name__) # Use standard logger if file fails
-    logger.error(f"Failed to initialize file logging to {LOG_FILE}", exc_info=True)
+    logger.error("Failed to initialize file logging to %s", LOG_FILE, exc_info=True)
 
 
 # --- Mock Business Functions ---
 
 def simulate_user_login():
     """Simulates a user login attempt."""
-    user = random.choice(USERNAMES)
-    ip = random.choice(SOURCE_IPS)
-    success = random.choices([True, False], weights=[90, 10], k=1)[0] # 90% success rate
+    user = user_picker.pick()
+    ip = ip_picker.pick()
+    success = login_success_picker.pick()
 
     log_data = {'user': user, 'source_ip': ip, 'action': 'login'}
     if success:
         log_data['status'] = 'SUCCESS'
-        logger.info(f"User '{user}' logged in successfully.", extra=log_data)
+        logger.info("User '%s' logged in successfully.", user, extra=log_data)
     else:
         log_data['status'] = 'FAILED'
-        logger.warning(f"User '{user}' failed login attempt.", extra=log_data)
+        logger.warning("User '%s' failed login attempt.", user, extra=log_data)
 
 def simulate_data_access():
     """Simulates accessing a data resource."""
-    user = random.choice(USERNAMES)
-    ip = random.choice(SOURCE_IPS)
-    resource = random.choice(RESOURCES)
-    action_type = random.choice(["read_data", "write_data"])
-    allowed = random.choices([True, False], weights=[85, 15], k=1)[0] # 85% allowed rate
+    user = user_picker.pick()
+    ip = ip_picker.pick()
+    resource = resource_picker.pick()
+    action_type = data_action_picker.pick()
+    allowed = access_allowed_picker.pick()
 
     log_data = {'user': user, 'source_ip': ip, 'action': action_type, 'resource': resource}
     if allowed:
         log_data['status'] = 'SUCCESS'
-        logger.info(f"User '{user}' {action_type.replace('_',' ')} on resource '{resource}'.", extra=log_data)
+        logger.info("User '%s' %s on resource '%s'.", user, action_type.replace('_',' '), resource, extra=log_data)
     else:
         log_data['status'] = 'ACCESS_DENIED'
-        logger.error(f"User '{user}' denied access for {action_type.replace('_',' ')} on resource '{resource}'.", extra=log_data)
+        logger.error("User '%s' denied access for %s on resource '%s'.", user, action_type.replace('_',' '), resource, extra=log_data)
 
 def simulate_transaction():
     """Simulates processing a transaction."""
-    user = random.choice(USERNAMES)
-    ip = random.choice(SOURCE_IPS)
+    user = user_picker.pick()
+    ip = ip_picker.pick()
     transaction_id = f"txn_{int(time.time())}_{random.randint(1000, 9999)}"
-    status = random.choice(TRANSACTION_STATUS)
+    status = transaction_status_picker.pick()
 
     log_data = {
         'user': user,
@@ -116,27 +164,31 @@ def simulate_transaction():
     if status == "SUCCESS":
         amount = round(random.uniform(5.0, 500.0), 2)
         log_data['details'] = f"amount: {amount}"
-        logger.info(f"Transaction '{transaction_id}' processed successfully for user '{user}'. Amount: ${amount}", extra=log_data)
+        logger.info("Transaction '%s' processed successfully for user '%s'. Amount: $%s", transaction_id, user, amount, extra=log_data)
     else:
-        logger.warning(f"Transaction '{transaction_id}' failed for user '{user}'. Reason: {status}", extra=log_data)
+        logger.warning("Transaction '%s' failed for user '%s'. Reason: %s", transaction_id, user, status, extra=log_data)
 
 # --- Main Simulation Loop ---
 if __name__ == "__main__":
     logger.info("Starting mock application simulation.", extra={'action': 'simulation_start'})
     start_time = time.time()
+    action_picker = RandomPicker([
+        simulate_user_login,
+        simulate_data_access,
+        simulate_transaction
+    ])
 
     try:
         while time.time() - start_time < SIMULATION_DURATION_SECONDS:
             # Choose a random action to simulate
-            action_func = random.choice([
-                simulate_user_login,
-                simulate_data_access,
-                simulate_transaction
-            ])
+            action_func = action_picker.pick()
 
             # Execute the chosen action
             action_func()
 
+            if LOAD_TEST_MODE:
+                continue
+
             # Wait for a random delay before the next action
             delay = random.uniform(MIN_DELAY_SECONDS, MAX_DELAY_SECONDS)
             time.sleep(delay)
@@ -144,9 +196,9 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Simulation interrupted by user.", extra={'action': 'simulation_stop', 'status': 'INTERRUPTED'})
     except Exception as e:
-         logger.error(f"An unexpected error occurred during simulation: {e}", exc_info=True, extra={'action': 'simulation_error'})
+         logger.error("An unexpected error occurred during simulation: %s", e, exc_info=True, extra={'action': 'simulation_error'})
     finally:
         end_time = time.time()
         total_duration = end_time - start_time
-        logger.info(f"Mock application simulation finished. Duration: {total_duration:.2f} seconds.", extra={'action': 'simulation_end', 'status': 'COMPLETED', 'duration_seconds': round(total_duration, 2)})
+        logger.info("Mock application simulation finished. Duration: %.2f seconds.", total_duration, extra={'action': 'simulation_end', 'status': 'COMPLETED', 'duration_seconds': round(total_duration, 2)})
 
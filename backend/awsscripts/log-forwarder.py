@@ -1,11 +1,17 @@
 import boto3
+from botocore.config import Config
 import time
 import os
+import signal
+import sys
 import requests # To get instance metadata
 import logging
 import json
+import zlib # For gzip-compressing upload batches
 from datetime import datetime
 import uuid # For unique object names
+from concurrent.futures import ThreadPoolExecutor
+from inotify_simple import INotify, flags # Wake on log writes instead of polling
 
 # --- Configuration ---
 LOG_FILE_PATH = '/var/log/mock_app.log'
@@ -13,25 +19,47 @@ STATE_FILE_PATH = '/var/lib/log_forwarder_state/mock_app.state' # Needs write pe
 S3_BUCKET_NAME = 'siemtool-ccs'
 # S3 prefix structure: base/instance_id/YYYY/MM/DD/HH/object_name
 S3_PREFIX_BASE = 'custom-forwarder-logs'
-UPLOAD_INTERVAL_SECONDS = 60 # How often to check for new logs and upload
+UPLOAD_INTERVAL_SECONDS = 60 # Fallback check interval when no file change events arrive
+EVENT_COALESCE_MS = 5000 # After the first change event, wait this long for more writes before reading
 MAX_BATCH_SIZE_BYTES = 1 * 1024 * 1024 # Upload batch if it reaches 1MB
 MAX_BATCH_LINES = 500 # Or upload if it reaches 500 lines
+STATE_WRITE_THRESHOLD_BYTES = 64 * 1024 # Persist the read offset after this much progress (and on exit)
 LOG_LEVEL = logging.INFO
 
+# Keep-alive S3 connections so an upload after an idle wait can reuse the
+# pooled TLS connection, and back off adaptively when S3 throttles
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=10,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True
+)
+
 # --- Logging Setup ---
 logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('LogForwarder')
 
 # --- EC2 Metadata ---
 METADATA_URL = "http://169.254.169.254/latest/meta-data/"
-METADATA_HEADERS = {"X-aws-ec2-metadata-token-ttl-seconds": "21600"} # For IMDSv2
+METADATA_TOKEN_TTL_SECONDS = 21600
+METADATA_HEADERS = {"X-aws-ec2-metadata-token-ttl-seconds": str(METADATA_TOKEN_TTL_SECONDS)} # For IMDSv2
 TOKEN_URL = "http://169.254.169.254/latest/api/token"
 
+# One session for all IMDS calls so the back-to-back lookups share a TCP connection
+imds_session = requests.Session()
+# IMDSv2 token and its expiry, reused until shortly before it expires
+metadata_token_cache = {'token': None, 'expires_at': 0.0}
+# Instance ID and region don't change while the instance runs, so successful lookups are kept
+metadata_cache = {}
+
 def get_metadata_token():
     """Gets a session token for IMDSv2."""
+    if metadata_token_cache['token'] and time.time() < metadata_token_cache['expires_at']:
+        return metadata_token_cache['token']
     try:
-        response = requests.put(TOKEN_URL, headers=METADATA_HEADERS)
+        response = imds_session.put(TOKEN_URL, headers=METADATA_HEADERS, timeout=1.0)
         response.raise_for_status()
+        metadata_token_cache['token'] = response.text
+        metadata_token_cache['expires_at'] = time.time() + METADATA_TOKEN_TTL_SECONDS - 60
         return response.text
     except requests.exceptions.RequestException as e:
         logger.warning(f"Could not get IMDSv2 token (this is ok for IMDSv1): {e}")
@@ -39,18 +67,24 @@ def get_metadata_token():
 
 def get_instance_metadata(path, token):
     """Gets specific metadata from EC2 instance."""
+    if path in metadata_cache:
+        return metadata_cache[path]
     headers = {}
     if token:
         headers["X-aws-ec2-metadata-token"] = token
     try:
-        response = requests.get(METADATA_URL + path, headers=headers, timeout=1.0)
+        response = imds_session.get(METADATA_URL + path, headers=headers, timeout=1.0)
         response.raise_for_status()
+        metadata_cache[path] = response.text
         return response.text
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to get instance metadata for {path}: {e}")
         return None
 
 # --- State Management ---
+# Offset most recently persisted by write_last_position (None until the first write)
+last_written_position = {'position': None}
+
 def read_last_position(state_file):
     """Reads the last byte offset from the state file."""
     try:
@@ -69,8 +103,16 @@ def read_last_position(state_file):
         logger.error(f"Error reading state file '{state_file}': {e}. Starting from beginning.", exc_info=True)
         return 0
 
-def write_last_position(state_file, position):
-    """Writes the last byte offset to the state file."""
+def write_last_position(state_file, position, force=False):
+    """
+    Writes the last byte offset to the state file.
+    Unless forced, skips the write until the offset has moved by at least
+    STATE_WRITE_THRESHOLD_BYTES (a reset to an earlier offset is always written).
+    """
+    last_written = last_written_position['position']
+    if (not force and last_written is not None and
+            0 <= position - last_written < STATE_WRITE_THRESHOLD_BYTES):
+        return
     try:
         # Ensure directory exists
         state_dir = os.path.dirname(state_file)
@@ -80,14 +122,34 @@ def write_last_position(state_file, position):
              # Might need sudo setup beforehand if not running as root
              os.makedirs(state_dir, exist_ok=True)
 
-        with open(state_file, 'w') as f:
+        # Write a temp file and rename it over the state file, so a crash can
+        # never leave a truncated state file behind (os.replace is atomic)
+        tmp_file = state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
             f.write(str(position))
+        os.replace(tmp_file, state_file)
+        last_written_position['position'] = position
     except IOError as e:
         logger.error(f"Error writing state file '{state_file}': {e}", exc_info=True)
 
+def split_lines(chunk, max_lines):
+    """
+    Splits up to max_lines lines ending in b'\n' off the front of chunk,
+    keeping the newlines; nothing past them is split. Unlike bytes.splitlines,
+    a bare b'\r' inside a record doesn't split it.
+    Returns the lines and their total size in bytes.
+    """
+    lines = chunk.split(b'\n', max_lines)
+    rest = lines.pop() # Whatever follows the last newline split on
+    lines = [line + b'\n' for line in lines]
+    if not lines:
+        # A single line without a newline fills the whole chunk
+        return [rest], len(rest)
+    return lines, len(chunk) - len(rest)
+
 # --- S3 Upload ---
-def upload_to_s3(s3_client, bucket, prefix, instance_id, content):
-    """Uploads log content to S3."""
+def upload_to_s3(s3_client, bucket, prefix, instance_id, lines):
+    """Uploads a batch of log lines (bytes) to S3, gzip-compressed."""
     now = datetime.utcnow()
     s3_key = os.path.join(
         prefix,
@@ -100,15 +162,20 @@ def upload_to_s3(s3_client, bucket, prefix, instance_id, content):
     )
 
     try:
-        # Compress content before uploading
-        import gzip
-        compressed_content = gzip.compress(content.encode('utf-8'))
+        # Compress line by line instead of joining the whole batch into one string first.
+        # wbits=31 writes a gzip header/trailer, matching ContentEncoding='gzip'
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        compressed = [compressor.compress(line) for line in lines]
+        compressed.append(compressor.flush())
+        body = b''.join(compressed)
+        line_count = len(lines)
+        compressed_size = len(body)
 
-        logger.info(f"Uploading {len(content.splitlines())} lines ({len(compressed_content)} bytes compressed) to s3://{bucket}/{s3_key}")
+        logger.info(f"Uploading {line_count} lines ({compressed_size} bytes compressed) to s3://{bucket}/{s3_key}")
         s3_client.put_object(
             Bucket=bucket,
             Key=s3_key,
-            Body=compressed_content,
+            Body=body,
             ContentEncoding='gzip',
             ContentType='text/plain' # Or application/json if strictly JSON lines
         )
@@ -117,6 +184,49 @@ def upload_to_s3(s3_client, bucket, prefix, instance_id, content):
         logger.error(f"Failed to upload to s3://{bucket}/{s3_key}: {e}", exc_info=True)
         return False
 
+def wait_for_upload(pending_upload):
+    """
+    Waits for a background upload to finish. On success records the batch's
+    end position in the state file and returns it, otherwise returns None.
+    """
+    future, end_position = pending_upload
+    if not future.result():
+        logger.error("Upload failed, will retry next cycle.")
+        return None
+    write_last_position(STATE_FILE_PATH, end_position)
+    return end_position
+
+# --- File Change Events ---
+def watch_log_file():
+    """
+    Creates an inotify watch for changes to LOG_FILE_PATH.
+    The directory is watched rather than the file so the watch survives
+    rotation and still reports the file being (re)created.
+    """
+    inotify = INotify()
+    inotify.add_watch(
+        os.path.dirname(LOG_FILE_PATH),
+        flags.MODIFY | flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+    )
+    return inotify
+
+def wait_for_log_activity(inotify):
+    """
+    Blocks until the log file is written, created or rotated, or until
+    UPLOAD_INTERVAL_SECONDS pass without any change (safety fallback).
+    """
+    log_name = os.path.basename(LOG_FILE_PATH)
+    deadline = time.monotonic() + UPLOAD_INTERVAL_SECONDS
+    while True:
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            return
+        # read_delay lets a burst of writes settle into one wakeup (and one batch)
+        events = inotify.read(timeout=remaining_ms, read_delay=EVENT_COALESCE_MS)
+        # Other files in the same directory also raise events, ignore those
+        if any(event.name == log_name for event in events):
+            return
+
 # --- Main Loop ---
 def main():
     logger.info("Starting custom log forwarder.")
@@ -133,18 +243,25 @@ def main():
     logger.info(f"Running on Instance ID: {instance_id} in Region: {region}")
 
     # Initialize S3 client - uses IAM role automatically
-    s3_client = boto3.client('s3', region_name=region)
+    s3_client = boto3.client('s3', region_name=region, config=S3_CLIENT_CONFIG)
+    # Background uploader so gzip + PUT of one batch overlaps reading the next
+    upload_executor = ThreadPoolExecutor(max_workers=1)
+    inotify = watch_log_file()
 
     last_position = read_last_position(STATE_FILE_PATH)
     current_inode = None
 
+    # A service stop sends SIGTERM, which would skip the finally block below;
+    # exit through SystemExit instead so progress below the threshold is saved
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     try:
         while True:
             try:
                 # Check if log file exists and get its inode
                 if not os.path.exists(LOG_FILE_PATH):
                     logger.warning(f"Log file '{LOG_FILE_PATH}' does not exist. Skipping iteration.")
-                    time.sleep(UPLOAD_INTERVAL_SECONDS)
+                    wait_for_log_activity(inotify)
                     continue
 
                 stat_info = os.stat(LOG_FILE_PATH)
@@ -159,52 +276,40 @@ def main():
 
                 if file_size > last_position:
                     logger.debug(f"File size ({file_size}) > last position ({last_position}). Reading new lines.")
-                    with open(LOG_FILE_PATH, 'r') as f:
-                        f.seek(last_position)
-                        lines_batch = []
-                        batch_size_bytes = 0
-                        new_position = last_position
-
+                    # Binary mode so offsets are plain byte counts and lines need no re-encoding
+                    with open(LOG_FILE_PATH, 'rb') as f:
+                        read_position = last_position
+                        pending_upload = None # (future, end position) of the batch being uploaded
                         while True:
-                            line = f.readline()
-                            if not line: # Reached end of file
-                                break
-
-                            line_bytes = len(line.encode('utf-8'))
-                            # Check if adding line exceeds limits
-                            if (batch_size_bytes + line_bytes > MAX_BATCH_SIZE_BYTES or
-                                len(lines_batch) >= MAX_BATCH_LINES):
-                                # Upload current batch before adding new line
-                                if lines_batch:
-                                    upload_success = upload_to_s3(s3_client, S3_BUCKET_NAME, S3_PREFIX_BASE, instance_id, "".join(lines_batch))
-                                    if upload_success:
-                                        write_last_position(STATE_FILE_PATH, new_position)
-                                        last_position = new_position
-                                        lines_batch = []
-                                        batch_size_bytes = 0
-                                    else:
-                                        logger.error("Upload failed, will retry next cycle.")
-                                        # Break inner loop to wait before retrying upload
-                                        break
-
-                            # Add line to current batch
-                            lines_batch.append(line)
-                            batch_size_bytes += line_bytes
-                            new_position = f.tell() # Update position after successful read
-
-                        # Upload any remaining lines in the last batch
-                        if lines_batch:
-                             upload_success = upload_to_s3(s3_client, S3_BUCKET_NAME, S3_PREFIX_BASE, instance_id, "".join(lines_batch))
-                             if upload_success:
-                                 write_last_position(STATE_FILE_PATH, new_position)
-                                 last_position = new_position
-                             else:
-                                 logger.error("Final batch upload failed, will retry next cycle.")
-                        elif new_position > last_position:
-                            # If we read lines but didn't upload (e.g. small amount), still update state
-                            write_last_position(STATE_FILE_PATH, new_position)
-                            last_position = new_position
+                            f.seek(read_position)
+                            # Read up to one batch worth of bytes and keep only complete lines
+                            chunk = f.read(MAX_BATCH_SIZE_BYTES)
+                            last_newline = chunk.rfind(b'\n')
+                            if last_newline != -1:
+                                chunk = chunk[:last_newline + 1]
+                            elif len(chunk) < MAX_BATCH_SIZE_BYTES:
+                                break # Nothing new, or only a partially written line so far
+                            # Otherwise a single line fills the whole batch, upload it as is
+
+                            lines_batch, batch_size_bytes = split_lines(chunk, MAX_BATCH_LINES)
+
+                            # Only one upload is in flight, so the state file advances in order
+                            if pending_upload is not None:
+                                uploaded_position = wait_for_upload(pending_upload)
+                                pending_upload = None
+                                if uploaded_position is None:
+                                    break
+                                last_position = uploaded_position
+
+                            # Compress and upload in the background while the next batch is read
+                            read_position += batch_size_bytes
+                            future = upload_executor.submit(upload_to_s3, s3_client, S3_BUCKET_NAME, S3_PREFIX_BASE, instance_id, lines_batch)
+                            pending_upload = (future, read_position)
 
+                        if pending_upload is not None:
+                            uploaded_position = wait_for_upload(pending_upload)
+                            if uploaded_position is not None:
+                                last_position = uploaded_position
 
                 else:
                     logger.debug("No new lines detected.")
@@ -218,13 +323,17 @@ def main():
             except Exception as e:
                 logger.error(f"An unexpected error occurred: {e}", exc_info=True)
 
-            # Wait before checking again
-            logger.debug(f"Sleeping for {UPLOAD_INTERVAL_SECONDS} seconds.")
-            time.sleep(UPLOAD_INTERVAL_SECONDS)
+            # Wait for the log file to change (or the fallback interval) before checking again
+            logger.debug(f"Waiting up to {UPLOAD_INTERVAL_SECONDS} seconds for log activity.")
+            wait_for_log_activity(inotify)
 
     except KeyboardInterrupt:
         logger.info("Log forwarder stopped by user.")
     finally:
+        inotify.close()
+        upload_executor.shutdown(wait=True)
+        # Persist progress that stayed below the write threshold
+        write_last_position(STATE_FILE_PATH, last_position, force=True)
         logger.info("Log forwarder exiting.")
 
 if __name__ == "__main__":
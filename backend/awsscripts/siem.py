@@ -8,6 +8,9 @@ import sys
 API_BASE_URL = "https://vebsnzh5ob.execute-api.us-east-2.amazonaws.com" # Replace with your URL
 API_ENDPOINT = "/logs" # The route path you configured
 
+# Reused across calls so successive fetches keep the TLS connection to API Gateway alive
+session = requests.Session()
+
 # --- API Call Function (Copied from api_caller_script_v1) ---
 def fetch_logs(base_url, endpoint, params=None):
     """Calls the API Gateway endpoint to fetch logs."""
@@ -24,7 +27,7 @@ def fetch_logs(base_url, endpoint, params=None):
 
     try:
         # Make the GET request with parameters and a timeout
-        response = requests.get(full_url, headers=headers, params=filtered_params, timeout=60) # 60-second timeout
+        response = session.get(full_url, headers=headers, params=filtered_params, timeout=60) # 60-second timeout
         response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
 
         print(f"API Status Code: {response.status_code}")
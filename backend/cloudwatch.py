@@ -1,114 +1,298 @@
-import boto3
+import functools
+import hashlib
 import os
-import json
+import queue
+import threading
+import time
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-def get_cloudwatch_logs():
+from aws_clients import get_client
+
+# Shared pool for background page fetches and ETag lookups, bounded across
+# concurrent requests. A streaming request holds one worker until its response
+# is closed and its ETag lookup may briefly take another, so this should be
+# at least twice the number of server threads
+PAGE_FETCHER_WORKERS = int(os.getenv('CLOUDWATCH_PAGE_WORKERS', '32'))
+_PAGE_FETCHER = ThreadPoolExecutor(max_workers=PAGE_FETCHER_WORKERS, thread_name_prefix='cloudwatch-pages')
+# Queued by _fetch_pages once the last page (or an error) has been delivered
+_END_OF_STREAM = object()
+# Pages buffered ahead of the consumer; bounds memory while streaming
+_MAX_BUFFERED_PAGES = 4
+# How often a producer blocked on a full queue rechecks whether the consumer has gone
+_PAGE_PUT_POLL_SECONDS = 1
+# How long a producer waits for room in the queue before giving up on the consumer
+_PAGE_PUT_TIMEOUT_SECONDS = 60
+# How long the consumer waits for the next page before giving up on the stream
+_PAGE_GET_TIMEOUT_SECONDS = 60
+
+def _put_page(pages, stop, item):
+    """
+    Puts item on the pages queue, waiting while the consumer is still there,
+    but no longer than _PAGE_PUT_TIMEOUT_SECONDS in total.
+    Returns False if the consumer stopped reading before there was room.
+    """
+    deadline = time.monotonic() + _PAGE_PUT_TIMEOUT_SECONDS
+    while not stop.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False # The consumer never came back (e.g. its response was never iterated)
+        try:
+            pages.put(item, timeout=min(_PAGE_PUT_POLL_SECONDS, remaining))
+            return True
+        except queue.Full:
+            continue # A slow consumer is still reading, keep waiting
+    return False
+
+def _fetch_pages(logs_client, kwargs, pages, stop):
+    """
+    Walks the log stream page by page, putting each get_log_events response
+    on the pages queue. An exception stops pagination and is queued as well.
+    Unless the consumer has gone away, _END_OF_STREAM is always queued last.
+    """
+    next_token = None
+    while not stop.is_set():
+        if next_token:
+            kwargs['nextToken'] = next_token
+
+        try:
+            response = logs_client.get_log_events(**kwargs)
+        except Exception as e:
+            _put_page(pages, stop, e)
+            break
+        if not _put_page(pages, stop, response):
+            return # Nobody is reading pages anymore (e.g. the client disconnected)
+
+        # Check if the same token is returned, indicating end of stream
+        returned_token = response.get('nextForwardToken')
+        if returned_token == next_token or not returned_token:
+            break # No more pages
+
+        next_token = returned_token
+    _put_page(pages, stop, _END_OF_STREAM)
+
+class LogRecordStream:
+    """
+    Iterates formatted log dictionaries from the first page and every page queued
+    after it. Errors after the first page end the stream early, keeping what was
+    sent; `complete` is only True once the whole stream has been read.
+    Call close() when the stream won't be read (further), so the producer stops.
+    """
+    def __init__(self, first_page, pages, stop, log_stream_name):
+        self.first_page = first_page
+        self.pages = pages
+        self.stop = stop
+        self.log_stream_name = log_stream_name
+        self.complete = False
+
+    def __iter__(self):
+        page = self.first_page
+        try:
+            while page is not _END_OF_STREAM:
+                if isinstance(page, Exception):
+                    # Might happen if stream was deleted or a call failed mid-pagination
+                    print(f"Warning: stopped paginating log stream '{self.log_stream_name}': {page}")
+                    return
+                yield from _format_events(page.get('events', []))
+                try:
+                    page = self.pages.get(timeout=_PAGE_GET_TIMEOUT_SECONDS)
+                except queue.Empty:
+                    print(f"Warning: timed out waiting for the next page of log stream '{self.log_stream_name}'")
+                    return
+            self.complete = True
+        finally:
+            # Let the producer stop early if the consumer went away
+            self.close()
+
+    def close(self):
+        """Tells the producer to stop; safe to call more than once."""
+        self.stop.set()
+
+@functools.lru_cache(maxsize=1024)
+def _iso_second(seconds):
+    """Formats a whole epoch second; events in a batch mostly share a handful of seconds."""
+    return datetime.fromtimestamp(seconds).isoformat()
+
+def _iso_from_ms(epoch_ms):
+    """
+    Equivalent to datetime.fromtimestamp(epoch_ms / 1000).isoformat(), but only
+    builds a datetime once per distinct second.
+    """
+    seconds, millis = divmod(epoch_ms, 1000)
+    if millis:
+        return f"{_iso_second(seconds)}.{millis * 1000:06d}"
+    return _iso_second(seconds)
+
+# Placeholder for messages that could not be decoded (JSON null parses to None)
+_UNPARSED = object()
+
+def _parse_messages(events):
+    """
+    Decodes the JSON message of every event in one pass.
+    Messages that aren't valid JSON come back as _UNPARSED.
+    """
+    loads = orjson.loads
+    parsed = []
+    append = parsed.append
+    remaining = iter(events)
+    while True:
+        try:
+            # A single try covers the whole run of valid messages; a malformed
+            # one only interrupts the loop, which resumes right after it
+            for event in remaining:
+                append(loads(event['message']))
+            return parsed
+        except orjson.JSONDecodeError:
+            append(_UNPARSED)
+
+def _format_events(events):
+    """
+    Converts raw CloudWatch log events into dictionaries for the frontend.
+    Attribute lookups are bound once up front since this runs per event.
+    """
+    iso_from_ms = _iso_from_ms
+    formatted_logs = []
+    append = formatted_logs.append
+
+    for event, log_data in zip(events, _parse_messages(events)):
+        if log_data is _UNPARSED:
+            # Handle cases where a log message isn't valid JSON
+            append({
+                "timestamp": iso_from_ms(event['timestamp']),
+                "ingestionTime": iso_from_ms(event['ingestionTime']),
+                "message": event['message'],
+                "level": "RAW", # Indicate it wasn't parsed
+                "eventTimestampMs": event['timestamp'],
+            })
+            continue
+        try:
+            # Add the ingestion time from CloudWatch if needed
+            log_data['ingestionTime'] = iso_from_ms(event['ingestionTime'])
+            # Raw CloudWatch timestamp, which is what the `since` parameter compares against
+            log_data['eventTimestampMs'] = event['timestamp']
+            # Ensure timestamp from the log itself is present
+            if 'timestamp' not in log_data and 'timestamp' in event:
+                 log_data['original_timestamp'] = iso_from_ms(event['timestamp'])
+            append(log_data)
+        except Exception as e:
+             print(f"Error processing single log event: {e}") # Log error server-side
+             append({
+                "timestamp": iso_from_ms(event['timestamp']),
+                "ingestionTime": iso_from_ms(event['ingestionTime']),
+                "message": event['message'],
+                "level": "ERROR",
+                "details": f"Parsing error: {e}",
+                "eventTimestampMs": event['timestamp'],
+             })
+
+    return formatted_logs
+
+def _load_config():
+    """
+    Reads the CloudWatch settings from environment variables.
+    Returns them as a dict, or None if any of them is missing.
+    """
+    config = {
+        'region_name': os.getenv('AWS_REGION'),
+        'log_group_name': os.getenv('AWS_LOG_GROUP_NAME'),
+        'log_stream_name': os.getenv('AWS_LOG_STREAM_NAME'),
+        'aws_access_key_id': os.getenv('AWS_ACCESS_KEY_ID'),
+        'aws_secret_access_key': os.getenv('AWS_SECRET_ACCESS_KEY'),
+    }
+    if not all(config.values()):
+        return None
+    return config
+
+def iter_cloudwatch_logs(since_ms=None):
     """
     Fetches log events from the specified CloudWatch Log Stream.
-    Parses JSON messages into dictionaries.
+    If since_ms (epoch milliseconds) is given, only events whose timestamp is
+    at or after it are fetched.
+    On success returns a LogRecordStream of parsed log dictionaries, yielded
+    page by page as pagination continues, together with a 200 status.
     """
     try:
         # Use environment variables for configuration
-        region_name = os.getenv('AWS_REGION')
-        log_group_name = os.getenv('AWS_LOG_GROUP_NAME')
-        log_stream_name = os.getenv('AWS_LOG_STREAM_NAME')
-        aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-        aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-
-        if not all([region_name, log_group_name, log_stream_name, aws_access_key_id, aws_secret_access_key]):
+        config = _load_config()
+        if config is None:
              return {"error": "Missing AWS configuration in environment variables."}, 500
+        log_group_name = config['log_group_name']
+        log_stream_name = config['log_stream_name']
 
-        # Initialize Boto3 client for CloudWatch Logs
-        logs_client = boto3.client(
-            'logs',
-            region_name=region_name,
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
+        # Reuse the cached Boto3 client for CloudWatch Logs
+        logs_client = get_client('logs', config['region_name'], config['aws_access_key_id'], config['aws_secret_access_key'])
+
+        kwargs = {
+            'logGroupName': log_group_name,
+            'logStreamName': log_stream_name,
+            'startFromHead': True,
+            'limit': 1000 # Keep limit per request reasonable
+        }
+        if since_ms is not None:
+            kwargs['startTime'] = since_ms # Only fetch the delta the caller hasn't seen
+
+        # Fetch pages on a background thread so the next page is already in
+        # flight while the current one is being parsed
+        pages = queue.Queue(maxsize=_MAX_BUFFERED_PAGES)
+        stop = threading.Event()
+        _PAGE_FETCHER.submit(_fetch_pages, logs_client, kwargs, pages, stop)
+
+        # Wait for the first page so a missing stream or bad credentials are
+        # still reported with an error status before anything is streamed
+        try:
+            first_page = pages.get(timeout=_PAGE_GET_TIMEOUT_SECONDS)
+        except queue.Empty:
+            stop.set()
+            return {"error": "Timed out waiting for CloudWatch logs."}, 504
+        if isinstance(first_page, Exception):
+            stop.set() # The producer has already given up, don't let it wait for room
+        if isinstance(first_page, logs_client.exceptions.ResourceNotFoundException):
+            return {"error": f"Log stream '{log_stream_name}' not found in group '{log_group_name}'."}, 404
+        if isinstance(first_page, Exception):
+            print(f"Error during get_log_events pagination: {first_page}")
+            return {"error": f"An error occurred fetching CloudWatch logs: {str(first_page)}"}, 500
+
+        return LogRecordStream(first_page, pages, stop, log_stream_name), 200
 
-        events = []
-        next_token = None
-
-        while True:
-            kwargs = {
-                'logGroupName': log_group_name,
-                'logStreamName': log_stream_name,
-                'startFromHead': True,
-                'limit': 1000 # Keep limit per request reasonable
-            }
-            if next_token:
-                kwargs['nextToken'] = next_token
-
-            try:
-                response = logs_client.get_log_events(**kwargs)
-            except logs_client.exceptions.ResourceNotFoundException:
-                 # Check for ResourceNotFoundException specifically for get_log_events
-                 # Might happen if stream was deleted between checks or initial list
-                 if not events: # If no events were fetched at all, it's a 404
-                     return {"error": f"Log stream '{log_stream_name}' not found in group '{log_group_name}'."}, 404
-                 else: # If some events were fetched, just stop pagination
-                     print(f"Warning: Log stream '{log_stream_name}' disappeared during pagination.")
-                     break # Exit the loop, return what we have
-            except Exception as e:
-                 # Catch other potential errors during get_log_events
-                 print(f"Error during get_log_events pagination: {e}")
-                 # Return error only if we haven't fetched any events yet
-                 if not events:
-                     return {"error": f"An error occurred fetching CloudWatch logs: {str(e)}"}, 500
-                 else:
-                     break # Exit the loop
-
-            events.extend(response.get('events', []))
-
-            # Check if the same token is returned, indicating end of stream
-            returned_token = response.get('nextForwardToken')
-            if returned_token == next_token or not returned_token:
-                break # No more pages
-
-            next_token = returned_token
-            # Optional: Add a small delay to avoid potential rate limiting
-            # import time
-            # time.sleep(0.1)
-
-
-        formatted_logs = []
-
-        for event in events:
-            try:
-                # The message from business.py is a JSON string
-                log_data = json.loads(event['message'])
-                # Add the ingestion time from CloudWatch if needed
-                log_data['ingestionTime'] = datetime.fromtimestamp(event['ingestionTime'] / 1000).isoformat()
-                # Ensure timestamp from the log itself is present
-                if 'timestamp' not in log_data and 'timestamp' in event:
-                     log_data['original_timestamp'] = datetime.fromtimestamp(event['timestamp'] / 1000).isoformat()
-                formatted_logs.append(log_data)
-            except json.JSONDecodeError:
-                # Handle cases where a log message isn't valid JSON
-                formatted_logs.append({
-                    "timestamp": datetime.fromtimestamp(event['timestamp'] / 1000).isoformat(),
-                    "ingestionTime": datetime.fromtimestamp(event['ingestionTime'] / 1000).isoformat(),
-                    "message": event['message'],
-                    "level": "RAW", # Indicate it wasn't parsed
-                })
-            except Exception as e:
-                 print(f"Error processing single log event: {e}") # Log error server-side
-                 formatted_logs.append({
-                    "timestamp": datetime.fromtimestamp(event['timestamp'] / 1000).isoformat(),
-                    "ingestionTime": datetime.fromtimestamp(event['ingestionTime'] / 1000).isoformat(),
-                    "message": event['message'],
-                    "level": "ERROR",
-                    "details": f"Parsing error: {e}"
-                 })
-
-
-        # Add pagination handling here if needed using 'nextForwardToken'
-
-        return formatted_logs, 200
-
-    except logs_client.exceptions.ResourceNotFoundException:
-        return {"error": f"Log group '{log_group_name}' or stream '{log_stream_name}' not found."}, 404
     except Exception as e:
         print(f"Error fetching CloudWatch logs: {e}") # Log detailed error server-side
-        return {"error": f"An error occurred fetching CloudWatch logs: {str(e)}"}, 500
\ No newline at end of file
+        return {"error": f"An error occurred fetching CloudWatch logs: {str(e)}"}, 500
+
+def get_cloudwatch_logs_etag():
+    """
+    Returns an ETag for the current contents of the log stream, derived from
+    its newest event with a single cheap get_log_events call.
+    Returns None if it can't be determined.
+    """
+    config = _load_config()
+    if config is None:
+        return None
+
+    try:
+        logs_client = get_client('logs', config['region_name'], config['aws_access_key_id'], config['aws_secret_access_key'])
+        # Reading backwards from the tail returns the newest event first
+        response = logs_client.get_log_events(
+            logGroupName=config['log_group_name'],
+            logStreamName=config['log_stream_name'],
+            startFromHead=False,
+            limit=1
+        )
+    except Exception as e:
+        print(f"Error fetching CloudWatch log tail for ETag: {e}")
+        return None
+
+    events = response.get('events', [])
+    if events:
+        newest = events[-1]
+        fingerprint = f"{newest['timestamp']}:{newest['ingestionTime']}:{newest['message']}"
+    else:
+        fingerprint = ""
+    return hashlib.blake2b(fingerprint.encode(), digest_size=16).hexdigest()
+
+def start_cloudwatch_logs_etag():
+    """
+    Runs get_cloudwatch_logs_etag on the background page fetcher and returns
+    its future, so callers can bound how long they wait for it.
+    """
+    return _PAGE_FETCHER.submit(get_cloudwatch_logs_etag)
@@ -1,7 +1,27 @@
-import boto3
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from aws_clients import get_client
+
+# get_findings accepts at most 50 finding IDs per call
+_FINDINGS_BATCH_SIZE = 50
+# Shared pool for concurrent get_findings calls, bounded across requests
+_FINDINGS_FETCHER = ThreadPoolExecutor(max_workers=8, thread_name_prefix='guardduty-findings')
+# Most recently updated findings first
+_SORT_CRITERIA = {
+    'AttributeName': 'updatedAt',
+    'OrderBy': 'DESC'
+}
+
+def _dig(data, *path):
+    """Follows a path of keys through nested dicts, returning None on a miss."""
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
 def get_guardduty_findings():
     """
     Fetches GuardDuty findings for the specified AWS region.
@@ -15,13 +35,8 @@ def get_guardduty_findings():
         if not all([region_name, aws_access_key_id, aws_secret_access_key]):
              return {"error": "Missing AWS configuration in environment variables."}, 500
 
-        # Initialize Boto3 client for GuardDuty
-        guardduty_client = boto3.client(
-            'guardduty',
-            region_name=region_name,
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
+        # Reuse the cached Boto3 client for GuardDuty
+        guardduty_client = get_client('guardduty', region_name, aws_access_key_id, aws_secret_access_key)
 
         # 1. Find the DetectorId
         detector_response = guardduty_client.list_detectors()
@@ -32,8 +47,9 @@ def get_guardduty_findings():
 
         detector_id = detector_ids[0] # Assuming only one detector per region
 
-        # 2. List Finding IDs (get recent ones, adjust sort criteria/filters as needed)
-        finding_response = guardduty_client.list_findings(
+        # 2. List all Finding IDs (adjust sort criteria/filters as needed)
+        paginator = guardduty_client.get_paginator('list_findings')
+        pages = paginator.paginate(
             DetectorId=detector_id,
             FindingCriteria={
                 'Criterion': {
@@ -46,25 +62,28 @@ def get_guardduty_findings():
                      }
                 }
             },
-             SortCriteria={
-                 'AttributeName': 'updatedAt',
-                 'OrderBy': 'DESC' # Get most recent first
-             },
-             MaxResults=50 # Limit the number of findings returned initially
+            SortCriteria=_SORT_CRITERIA,
+            PaginationConfig={'PageSize': _FINDINGS_BATCH_SIZE}
         )
 
-        finding_ids = finding_response.get('FindingIds', [])
+        finding_ids = [finding_id for page in pages for finding_id in page.get('FindingIds', [])]
 
         if not finding_ids:
             return {"message": "No active GuardDuty findings found matching criteria."}, 200
 
-        # 3. Get Finding Details
-        findings_details_response = guardduty_client.get_findings(
-            DetectorId=detector_id,
-            FindingIds=finding_ids
-        )
+        # 3. Get Finding Details, one concurrent get_findings call per batch of IDs
+        batches = [finding_ids[i:i + _FINDINGS_BATCH_SIZE] for i in range(0, len(finding_ids), _FINDINGS_BATCH_SIZE)]
+
+        def get_findings_batch(batch):
+            response = guardduty_client.get_findings(
+                DetectorId=detector_id,
+                FindingIds=batch,
+                SortCriteria=_SORT_CRITERIA
+            )
+            return response.get('Findings', [])
 
-        findings = findings_details_response.get('Findings', [])
+        # map() preserves batch order, so findings stay most recent first
+        findings = [finding for batch_findings in _FINDINGS_FETCHER.map(get_findings_batch, batches) for finding in batch_findings]
 
         # Format findings for easier frontend use
         formatted_findings = []
@@ -80,12 +99,12 @@ def get_guardduty_findings():
                 "created_at": finding.get('CreatedAt'), # Already in ISO 8601 format
                 "updated_at": finding.get('UpdatedAt'),
                 # Extract key resource details if available
-                "resource_type": finding.get('Resource', {}).get('ResourceType'),
+                "resource_type": _dig(finding, 'Resource', 'ResourceType'),
                 # Example: Get instance ID if it's an EC2 finding
-                "instance_id": finding.get('Resource', {}).get('InstanceDetails', {}).get('InstanceId'),
+                "instance_id": _dig(finding, 'Resource', 'InstanceDetails', 'InstanceId'),
                 # Example: Get affected access key if relevant
-                 "access_key_id": finding.get('Resource', {}).get('AccessKeyDetails', {}).get('AccessKeyId'),
-                 "user_name": finding.get('Resource', {}).get('AccessKeyDetails', {}).get('UserName'),
+                 "access_key_id": _dig(finding, 'Resource', 'AccessKeyDetails', 'AccessKeyId'),
+                 "user_name": _dig(finding, 'Resource', 'AccessKeyDetails', 'UserName'),
                 # Add more relevant fields as needed
             }
             # Clean up None values if desired, though None might be informative
@@ -93,8 +112,6 @@ def get_guardduty_findings():
             formatted_findings.append(formatted_finding)
 
 
-        # Add pagination handling here for list_findings if needed
-
         return formatted_findings, 200
 
     except Exception as e:
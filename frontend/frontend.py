@@ -1,12 +1,24 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import pandas as pd
+import numpy as np
 import json # Import json for potential error message parsing
 import re # Import re for title conversion
-from streamlit_autorefresh import st_autorefresh # Import the autorefresh component
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Configuration ---
 BACKEND_URL = "http://127.0.0.1:5000" # Default Flask dev server URL
+# (connect, read) seconds. The backend can take up to 70 s before sending headers
+# (10 s ETag lookup plus 60 s for the first CloudWatch page), so read waits longer
+BACKEND_TIMEOUT = (2, 75)
+REFRESH_SECONDS = 10 # How often the logs tab refreshes
+# Cached fetches expire just before the next refresh; a cache entry is written
+# one round trip after its refresh started, so a TTL equal to the interval
+# would still be live at the next tick and skip every other refresh
+FETCH_CACHE_TTL_SECONDS = REFRESH_SECONDS - 1
 
 # --- Page Setup ---
 st.set_page_config(page_title="Cloud SIEM Platform", layout="wide")
@@ -15,65 +27,125 @@ st.title("☁️ Cloud-based SIEM Platform")
 st.caption("Real-time threat detection and comprehensive security monitoring on AWS infrastructure.")
 
 # --- Helper Functions ---
+@st.cache_resource
+def get_session():
+    """Returns a shared requests Session so backend connections are kept alive across reruns."""
+    session = requests.Session()
+    # Only retry failed connects; a read timeout means the backend is already
+    # working on the request, and retrying would start another CloudWatch fetch
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(connect=2, read=0, backoff_factor=0.2))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+@st.cache_resource
+def get_fetch_executor():
+    """Returns a shared thread pool for fetching backend endpoints concurrently."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix='backend-fetch')
+
 def fetch_data(endpoint):
-    """Fetches data from the backend API."""
+    """
+    Fetches data from the backend API.
+    Returns (data, data_hash, error_message). data_hash identifies the response
+    body so derived results can be reused while it is unchanged; error_message
+    is None on success. Nothing is drawn here, so it can run on a worker
+    thread; callers display the error.
+    """
     try:
-        response = requests.get(f"{BACKEND_URL}{endpoint}")
+        response = get_session().get(f"{BACKEND_URL}{endpoint}", timeout=BACKEND_TIMEOUT)
         response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-        return response.json()
+        data_hash = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+        return response.json(), data_hash, None
     except requests.exceptions.ConnectionError:
-        st.error(f"Connection Error: Could not connect to the backend at {BACKEND_URL}. Is the backend running?")
-        return None
+        return None, None, f"Connection Error: Could not connect to the backend at {BACKEND_URL}. Is the backend running?"
     except requests.exceptions.Timeout:
-        st.error("Error: The request to the backend timed out.")
-        return None
+        return None, None, "Error: The request to the backend timed out."
     except requests.exceptions.RequestException as e:
         # Try to parse potential JSON error message from backend
-        error_detail = ""
-        try:
-            error_json = e.response.json()
-            if isinstance(error_json, dict) and 'error' in error_json:
-                 error_detail = f": {error_json['error']}"
-            elif isinstance(error_json, dict) and 'message' in error_json: # Handle info messages too
-                 error_detail = f": {error_json['message']}"
-            else:
-                 error_detail = f": {e.response.text}" # Fallback to raw text
-        except:
-             error_detail = f": {str(e)}" # Fallback if response is not JSON
-
-        st.error(f"Error fetching data from {endpoint}{error_detail}")
-        return None
+        error_detail = f": {e}" # Fallback if there is no response or it is not JSON
+        if e.response is not None:
+            try:
+                error_json = e.response.json()
+                if isinstance(error_json, dict) and 'error' in error_json:
+                     error_detail = f": {error_json['error']}"
+                elif isinstance(error_json, dict) and 'message' in error_json: # Handle info messages too
+                     error_detail = f": {error_json['message']}"
+                else:
+                     error_detail = f": {e.response.text}" # Fallback to raw text
+            except (ValueError, AttributeError, TypeError): # json.JSONDecodeError is a ValueError
+                 pass
+
+        return None, None, f"Error fetching data from {endpoint}{error_detail}"
     except json.JSONDecodeError as err: # Added 'err' variable
-         st.error(f"Error: Could not decode the response from {endpoint}. Received: {response.text[:200]}... Error: {err}") # Show part of response and error
-         return None
-
+         return None, None, f"Error: Could not decode the response from {endpoint}. Received: {response.text[:200]}... Error: {err}" # Show part of response and error
+
+@st.cache_data(ttl=FETCH_CACHE_TTL_SECONDS, show_spinner=False)
+def fetch_logs_cached():
+    """Fetches logs at most once per autorefresh interval; search reruns reuse the result."""
+    return fetch_data("/api/logs")
+
+@st.cache_data(ttl=FETCH_CACHE_TTL_SECONDS, show_spinner=False)
+def fetch_threats_cached():
+    """Fetches threats at most once per autorefresh interval; search reruns reuse the result."""
+    return fetch_data("/api/threats")
+
+def prefetch_all():
+    """
+    Fills the logs and threats caches concurrently, so a full rerun waits for
+    one backend round trip instead of two. Cache hits return immediately.
+    """
+    executor = get_fetch_executor()
+    for future in [executor.submit(fetch_logs_cached), executor.submit(fetch_threats_cached)]:
+        future.result()
+
+# Matches a lowercase-to-uppercase boundary in camelCase names
+CAMEL_CASE_BOUNDARY = re.compile(r"(\w)([A-Z])")
+
+@functools.lru_cache(maxsize=256) # Column names are a small fixed set, converted on every rerun
 def snake_to_title(snake_str):
     """Converts snake_case or camelCase to Title Case."""
     if not isinstance(snake_str, str):
         return str(snake_str) # Return string representation if not a string
     # Add space before capital letters (for camelCase)
-    s = re.sub(r"(\w)([A-Z])", r"\1 \2", snake_str)
+    s = CAMEL_CASE_BOUNDARY.sub(r"\1 \2", snake_str)
     # Replace underscores with spaces and capitalize words
     return s.replace('_', ' ').title()
 
-def style_severity(val):
-    """Applies background color based on severity label."""
-    val_lower = str(val).lower()
-    if 'low' in val_lower:
-        color = 'yellow'
-    elif 'medium' in val_lower:
-        color = 'orange'
-    elif 'high' in val_lower:
-        color = 'red'
-    elif 'critical' in val_lower:
-        color = 'darkred'; # Use darkred for critical for visibility
-        return f'background-color: {color}; color: white;' # Add white text for darkred
-    else:
-        color = '' # No style for others (e.g., Informational, Unknown)
-
-    return f'background-color: {color}' if color else ''
+# Severity label keywords and their cell styles, checked in order
+SEVERITY_STYLES = [
+    ('low', 'background-color: yellow'),
+    ('medium', 'background-color: orange'),
+    ('high', 'background-color: red'),
+    ('critical', 'background-color: darkred; color: white;'), # White text for darkred
+]
 
-def display_dataframe(data, search_term, column_order, date_columns, data_type=None):
+def style_severity(column):
+    """Returns background colors for a whole column of severity labels at once."""
+    labels = column.astype(str).str.lower()
+    conditions = [labels.str.contains(keyword, regex=False) for keyword, _ in SEVERITY_STYLES]
+    # No style for others (e.g., Informational, Unknown)
+    return np.select(conditions, [style for _, style in SEVERITY_STYLES], default='')
+
+def get_search_haystack(df_display, data_type, data_hash):
+    """
+    Returns one lowercased string per row with all displayed values, separated by
+    newlines so a search can't match across columns. Kept in session_state while
+    the same payload is displayed, so each keystroke only runs the contains pass.
+    """
+    state_key = f"_search_haystack_{data_type}"
+    cached = st.session_state.get(state_key)
+    if cached is not None and data_hash is not None and cached[0] == data_hash:
+        return cached[1]
+
+    columns = [df_display[col].fillna('').astype(str) for col in df_display.columns]
+    haystack = columns[0]
+    for column in columns[1:]:
+        haystack = haystack + '\n' + column
+    haystack = haystack.str.lower()
+    st.session_state[state_key] = (data_hash, haystack)
+    return haystack
+
+def display_dataframe(data, search_term, column_order, date_columns, data_type=None, data_hash=None):
     """Displays data in a searchable, formatted Pandas DataFrame with optional styling."""
     if not data:
         st.info("No data available.")
@@ -86,50 +158,73 @@ def display_dataframe(data, search_term, column_order, date_columns, data_type=N
              st.info(f"Backend Message: {data['message']}")
         return
 
+    # Idle refreshes usually bring back the same payload; redraw the table built
+    # for it last time instead of rebuilding the frame
+    render_state_key = f"_rendered_{data_type}"
+    render_key = (data_hash, search_term)
+    rendered = st.session_state.get(render_state_key)
+    if data_hash is not None and rendered is not None and rendered[0] == render_key:
+        st.dataframe(rendered[1], use_container_width=True)
+        return
+
     try:
-        df = pd.DataFrame(data)
+        # Build only the displayed columns, already in display order, instead of
+        # materializing every field and selecting a subset afterwards
+        present_columns = set().union(*data) # Records don't all share the same keys
+        display_columns = [col for col in column_order if col in present_columns]
+
+        if not display_columns:
+            st.warning("No columns available for display after processing.")
+            return
+
+        df = pd.DataFrame(data, columns=display_columns)
 
         if df.empty:
             st.info("No data matches the criteria.")
             return
 
+        # Map numeric GuardDuty severities to labels, keeping unknown values visible
+        if data_type == 'threats' and 'severity' in df.columns:
+            try:
+                severity = df['severity']
+                mapped = severity.map(SEVERITY_LABEL_MAP)
+                # map(str) always yields strings (astype(str) can keep NaN); missing values read as None
+                raw_labels = severity.map(str).where(severity.notna(), 'None')
+                df['severity'] = mapped.where(mapped.notna(), 'Unknown (' + raw_labels + ')')
+            except Exception as sev_e:
+                st.warning(f"Could not map severity levels: {sev_e}")
+
         # Format date columns
         for col in date_columns:
             if col in df.columns:
                 try:
-                    # Convert to datetime, coercing errors, then format
-                    df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
-                    # Replace NaT (Not a Time) that results from coercion errors with empty string or original value
-                    df[col] = df[col].fillna('') # Or handle as needed
+                    # Convert to datetime, coercing errors, then format. Both backends send
+                    # ISO 8601 strings, so the fast ISO parser is used instead of inferring a
+                    # format, and cache=True parses each repeated timestamp only once
+                    df[col] = (pd.to_datetime(df[col], errors='coerce', format='ISO8601', cache=True)
+                               .dt.strftime('%Y-%m-%d %H:%M:%S')
+                               .fillna('')) # Replace NaT (Not a Time) from coercion errors with empty string
                 except Exception as date_e:
                      st.warning(f"Could not format date column '{col}': {date_e}") # Warn if formatting fails
 
-        # Rename columns to Title Case
-        rename_map = {col: snake_to_title(col) for col in df.columns}
-        df.rename(columns=rename_map, inplace=True)
-
-        # Filter columns based on display order, maintaining Title Case
-        display_columns_title_case = [snake_to_title(col) for col in column_order if snake_to_title(col) in df.columns]
-
-        if not display_columns_title_case:
-            st.warning("No columns available for display after processing.")
-            return
-
-        df_display = df[display_columns_title_case]
-
+        # Relabel columns to Title Case in place (builds a single new Index)
+        df.columns = [snake_to_title(col) for col in df.columns]
+        df_display = df
 
         # Basic Search/Filter (applied AFTER formatting and column selection)
         if search_term:
             # Simple string search across the *displayed* columns (case-insensitive)
-            df_str = df_display.astype(str).apply(lambda row: ' '.join(row).lower(), axis=1)
-            df_display = df_display[df_str.str.contains(search_term.lower())]
+            haystack = get_search_haystack(df_display, data_type, data_hash)
+            df_display = df_display[haystack.str.contains(search_term.lower(), regex=False)]
 
         # Apply styling if applicable
         if data_type == 'threats' and 'Severity' in df_display.columns:
-            styler = df_display.style.applymap(style_severity, subset=['Severity'])
-            st.dataframe(styler, use_container_width=True)
+            table = df_display.style.apply(style_severity, subset=['Severity'])
         else:
-            st.dataframe(df_display, use_container_width=True) # Display the formatted and ordered dataframe
+            table = df_display # Display the formatted and ordered dataframe
+
+        st.session_state[render_state_key] = (render_key, table)
+        st.dataframe(table, use_container_width=True)
 
     except Exception as e:
         st.error(f"Error displaying data: {e}")
@@ -144,7 +239,7 @@ LOGS_COLUMN_ORDER = [
     'action', 'ingestionTime', 'level', 'message',
     'source_ip', 'status', 'user', 'resource', 'transactionId', 'details'
 ]
-LOGS_DATE_COLUMNS = ['ingestionTime']
+LOGS_DATE_COLUMNS = ['ingestionTime'] # Formatted as ISO 8601 by the backend, not epoch ms
 
 THREATS_COLUMN_ORDER = [
     'title', 'created_at', 'updated_at', 'description', 'severity', 'type',
@@ -152,64 +247,48 @@ THREATS_COLUMN_ORDER = [
 ]
 THREATS_DATE_COLUMNS = ['created_at', 'updated_at']
 
-tab1, tab2 = st.tabs(["📊 Logs", "🛡️ Threats"])
+# Severity mapping (simplified labels)
+SEVERITY_LABEL_MAP = {
+    0: "Informational", # Added for potential 0 value
+    1: "Low", 2: "Low", 3: "Low",
+    4: "Medium", 5: "Medium", 6: "Medium",
+    7: "High", 8: "High",
+    9: "Critical", 10: "Critical" # Assuming 9 and 10 exist
+}
 
-with tab1:
-    st.header("CloudWatch Logs")
-    search_logs = st.text_input("Search Logs", key="log_search", placeholder="Enter keyword to filter logs...")
+# Both tabs render on a full rerun, so fetch their data in parallel up front
+prefetch_all()
 
-    # Auto-refresh this tab every 10 seconds (10000 milliseconds)
-    st_autorefresh(interval=10 * 1000, key="logfetchrefresh")
+tab1, tab2 = st.tabs(["📊 Logs", "🛡️ Threats"])
 
-    logs_data = fetch_data("/api/logs")
+# Reruns only this function every REFRESH_SECONDS, so the threats tab isn't refetched or redrawn
+@st.fragment(run_every=REFRESH_SECONDS)
+def render_logs_tab():
+    """Fetches and displays the logs tab; typing in its search box also reruns just this part."""
+    # Served from cache when the rerun was triggered by typing in the search box
+    logs_data, logs_hash, logs_error = fetch_logs_cached()
+    search_logs = st.text_input("Search Logs", key="log_search", placeholder="Enter keyword to filter logs...")
 
     if logs_data is not None:
         # Ensure it's a list before passing
         display_data = logs_data if isinstance(logs_data, list) else []
-        display_dataframe(display_data, search_logs, LOGS_COLUMN_ORDER, LOGS_DATE_COLUMNS, data_type='logs')
+        display_dataframe(display_data, search_logs, LOGS_COLUMN_ORDER, LOGS_DATE_COLUMNS, data_type='logs', data_hash=logs_hash)
     else:
-        # Error message already displayed by fetch_data
-        pass
+        st.error(logs_error)
+
+with tab1:
+    st.header("CloudWatch Logs")
+    render_logs_tab()
 
 
 with tab2:
     st.header("GuardDuty Threats")
+    threats_data, threats_hash, threats_error = fetch_threats_cached()
     search_threats = st.text_input("Search Threats", key="threat_search", placeholder="Enter keyword to filter threats...")
-    threats_data = fetch_data("/api/threats")
 
-    processed_threats_data = [] # Initialize as empty list
     if threats_data is not None:
-         # Attempt to provide more meaningful severity display
-        if isinstance(threats_data, list) and threats_data:
-             try:
-                # Define severity mapping (simplified labels)
-                 severity_label_map = {
-                    0: "Informational", # Added for potential 0 value
-                    1: "Low", 2: "Low", 3: "Low",
-                    4: "Medium", 5: "Medium", 6: "Medium",
-                    7: "High", 8: "High",
-                    9: "Critical", 10: "Critical" # Assuming 9 and 10 exist
-                 }
-                 # Process data before converting to DataFrame for display
-                 processed_threats_data = []
-                 for finding in threats_data:
-                     # Make a copy to avoid modifying original data if fetched again
-                     processed_finding = finding.copy()
-                     if 'severity' in processed_finding:
-                         original_severity = processed_finding['severity']
-                         # Map the severity number to a label, keep original number if not found
-                         processed_finding['severity'] = severity_label_map.get(original_severity, f"Unknown ({original_severity})")
-                     processed_threats_data.append(processed_finding)
-
-             except Exception as e:
-                st.warning(f"Could not map severity levels: {e}")
-                processed_threats_data = threats_data # Use original data if processing fails
-
-        elif isinstance(threats_data, dict): # Handle potential error dict passed
-             processed_threats_data = threats_data # Pass dict directly to display_dataframe for error handling
-
-        # Display the processed data
-        display_dataframe(processed_threats_data, search_threats, THREATS_COLUMN_ORDER, THREATS_DATE_COLUMNS, data_type='threats')
+        # Lists are displayed (severity labels are mapped in display_dataframe), error dicts are reported
+        display_data = threats_data if isinstance(threats_data, (list, dict)) else []
+        display_dataframe(display_data, search_threats, THREATS_COLUMN_ORDER, THREATS_DATE_COLUMNS, data_type='threats', data_hash=threats_hash)
     else:
-        # Error message already displayed by fetch_data
-        pass
\ No newline at end of file
+        st.error(threats_error)
\ No newline at end of file